@@ -1,6 +1,8 @@
 # region imports
 from AlgorithmImports import *
 import math
+import numpy as np
+from numba import njit, prange
 # endregion
 
 '''
@@ -13,94 +15,248 @@ import math
 }
 '''
 
-class OpeningRangeBreakoutUniverseAlgorithm(QCAlgorithm):
+# ---------- parameters: name -> (type, default); stored on the algorithm as _<name with '-' -> '_'> ----------
+PARAMS = {
+    "universe-size":              (int,     1000),
+    "indicator-period":           (int,       14),     # days
+    "stop-loss-atr-distance":     (float,    0.5),     # ATR multiple
+    "stop-loss-risk-size":        (float,   0.01),     # risk fraction if SL hits
+    "max-positions":              (int,        8),
+    "opening-range-minutes":      (int,        5),
+    "entry-buffer-atr":           (float,   0.10),     # buffer beyond OR level
+    "leverage":                   (float,      4),
+    "atr-price-floor":            (float,   0.01),     # ATR/Price >= floor
+    "breakeven-trigger-R":        (float,    1.0),     # move SL to entry after +R
+    "time-stop-hhmm":             ("hhmm", (10,45)),   # e.g., "10:45"
+    "trail-ATR-mult":             (float,    1.5),     # trailing distance in ATRs AFTER breakeven
+    "margin-buffer":              (float,   0.90),
+    "retry-fraction":             (float,   0.50),
+    "trail-update-threshold-atr": (float,   0.25),     # throttle threshold
+    "trail-min-ticks":            (int,        2),
+
+    # Optional filters (defaults for 3-param optimizer)
+    "rvol-threshold":             (float,    1.8),     # >1 == abnormally high
+    "long-only":                  (bool,    True),
+    "gap-min-pct":                (float,    0.0),     # e.g., 1.0 = require 1% gap
+}
 
-    # ---------- helpers: robust parameter parsing ----------
-    def _p_str(self, name, default):
-        v = self.get_parameter(name)
-        return v if (v is not None and v != "") else default
-
-    def _p_int(self, name, default):
-        v = self.get_parameter(name)
-        try:    return int(v) if v not in (None, "") else default
-        except: return default
-
-    def _p_float(self, name, default):
-        v = self.get_parameter(name)
-        try:    return float(v) if v not in (None, "") else default
-        except: return default
-
-    def _p_bool(self, name, default):
-        v = self.get_parameter(name)
-        if v is None or v == "": return default
-        s = str(v).strip().lower()
-        if s in ("1","true","t","yes","y","on"):  return True
-        if s in ("0","false","f","no","n","off"): return False
+def _as_int(v, default):
+    try:    return int(v)
+    except: return default
+
+def _as_float(v, default):
+    try:    return float(v)
+    except: return default
+
+def _as_bool(v, default):
+    s = str(v).strip().lower()
+    if s in ("1","true","t","yes","y","on"):  return True
+    if s in ("0","false","f","no","n","off"): return False
+    return default
+
+def _as_hhmm(v, default):
+    """Parse 'HH:MM' -> (HH,MM), else return default."""
+    try:
+        t = datetime.strptime(str(v).strip(), "%H:%M")
+        return (t.hour, t.minute)
+    except ValueError:
         return default
 
-    def _p_hhmm(self, name, default_tuple):
-        """Parse 'HH:MM' -> (HH,MM), else return default_tuple."""
-        v = self.get_parameter(name)
-        if not v or not isinstance(v, str):
-            return default_tuple
-        try:
-            parts = v.strip().split(":")
-            if len(parts) != 2:
-                return default_tuple
-            hh, mm = int(parts[0]), int(parts[1])
-            if (0 <= hh and hh <= 23) and (0 <= mm and mm <= 59):
-                return (hh, mm)
-        except Exception:
-            pass
-        return default_tuple
+_PARSERS = {int: _as_int, float: _as_float, bool: _as_bool, "hhmm": _as_hhmm}
+
+# Kernels are compiled eagerly from explicit signatures (and cached on disk), so the first universe
+# rotation does not pay for JIT compilation.
+@njit("Tuple((f8[:], i8[:]))(f8[:, :], f8[:, :], f8[:, :], i8)", cache=True, parallel=True)
+def warm_atr(highs, lows, closes, period):
+    """Batch ATR over (N_symbols, N_days) daily bars, NaN-padded on the left -> (atr, samples).
+
+    Running mean of TR for the first `period` samples, Wilder smoothing after (same rule as _on_daily_bar).
+    """
+    n, days = highs.shape
+    atr = np.zeros(n)
+    samples = np.zeros(n, dtype=np.int64)
+    for i in prange(n):
+        a = 0.0
+        k = 0
+        prev_close = np.nan
+        for j in range(days):
+            h = highs[i, j]
+            l = lows[i, j]
+            c = closes[i, j]
+            if np.isnan(c):
+                continue
+            tr = h - l
+            if not np.isnan(prev_close):
+                tr = max(tr, abs(h - prev_close), abs(l - prev_close))
+            k += 1
+            if k <= period:
+                a += (tr - a) / k
+            else:
+                a = (a * (period - 1) + tr) / period
+            prev_close = c
+        atr[i] = a
+        samples[i] = k
+    return atr, samples
+
+@njit("void(i8[:], f8[:], f8[:], f8[:], f8[:], f8[:], i8[:], f8[:], f8[:], i8)", cache=True)
+def fold_daily_bars(ids, times, highs, lows, closes, atr, atr_n, prev_close, atr_time, period):
+    """Fold queued daily bars into the per-id ATR state in arrival order (same rule as warm_atr).
+
+    Bars at or before an id's atr_time were already covered by the batch warm-up and are skipped.
+    """
+    for j in range(ids.size):
+        i = ids[j]
+        if times[j] <= atr_time[i]:
+            continue
+        h = highs[j]
+        l = lows[j]
+        tr = h - l
+        if not np.isnan(prev_close[i]):
+            tr = max(tr, abs(h - prev_close[i]), abs(l - prev_close[i]))
+        k = atr_n[i] + 1
+        a = 0.0 if k == 1 else atr[i]
+        atr[i] = a + (tr - a) / k if k <= period else (a * (period - 1) + tr) / period
+        atr_n[i] = k
+        prev_close[i] = closes[j]
+        atr_time[i] = times[j]
+
+
+class OpeningRangeBreakoutUniverseAlgorithm(QCAlgorithm):
+
+    # ---------- helpers: robust parameter parsing ----------
+    def _load_parameters(self):
+        for name, (kind, default) in PARAMS.items():
+            v = self.get_parameter(name)
+            value = default if v is None or v == "" else _PARSERS[kind](v, default)
+            setattr(self, "_" + name.replace("-", "_"), value)
+
+    # ---------- helpers: per-security trade state (SoA) ----------
+    # Numeric trade state lives in parallel arrays indexed by a dense id per security (sec.sid),
+    # so on_data can update every open position in one vectorized pass. Tickets stay on the Security.
+    _STATE_FIELDS = (
+        # name        dtype       reset
+        ("_entry",    np.float64, np.nan),   # entry fill price
+        ("_stop",     np.float64, np.nan),   # current stop level
+        ("_oneR",     np.float64, np.nan),   # |entry - initial stop|
+        ("_hw",       np.float64, np.nan),   # high water since entry
+        ("_lw",       np.float64, np.nan),   # low water since entry
+        ("_last_upd", np.float64, np.nan),   # timestamp of last stop update (throttle: once per bar)
+        ("_dir",      np.int8,    0),        # +1 long, -1 short
+        ("_moved_be", np.bool_,   False),    # stop moved to breakeven
+    )
+    # Daily ATR state per id (not reset with the tickets)
+    _ATR_FIELDS = (
+        ("_atr",       np.float64, np.nan),  # current ATR value
+        ("_atr_n",     np.int64,   0),       # TR samples seen (ready once >= indicator-period)
+        ("_prev_close", np.float64, np.nan), # last completed daily close (next TR, gap filter)
+        ("_atr_time",  np.float64, np.nan),  # end-time timestamp of the last bar folded in
+    )
+    # Opening-range aggregates per id, captured live from the first N minute bars (reset every session)
+    _OR_FIELDS = (
+        ("_or_open",  np.float64, np.nan),
+        ("_or_high",  np.float64, -np.inf),
+        ("_or_low",   np.float64, np.inf),
+        ("_or_close", np.float64, np.nan),
+        ("_or_vol",   np.float64, 0.0),
+        ("_or_count", np.int64,   0),
+    )
+    # Static per-security constants, cached once when the security is added
+    _SEC_FIELDS = (
+        ("_tick",       np.float64, 0.01),   # minimum price variation
+    )
+    # Opening-range volume SMA per id: circular buffer of the last indicator-period sessions plus a running sum
+    _VOL_FIELDS = (
+        ("_vol_buf",  np.float64, 0.0),      # (capacity, indicator-period) OR volumes, oldest overwritten first
+        ("_vol_pos",  np.int64,   0),        # next slot to overwrite
+        ("_vol_sum",  np.float64, 0.0),      # sum of the buffer
+        ("_vol_n",    np.int64,   0),        # sessions seen, capped at indicator-period (ready once full)
+    )
+    _SOA_FIELDS = _STATE_FIELDS + _ATR_FIELDS + _OR_FIELDS + _SEC_FIELDS + _VOL_FIELDS
+
+    def _init_state(self, capacity):
+        self._ids = {}  # Symbol -> dense id
+        cols = {"_vol_buf": (self._indicator_period,)}
+        for name, dtype, fill in self._SOA_FIELDS:
+            setattr(self, name, np.full((capacity,) + cols.get(name, ()), fill, dtype=dtype))
+
+    def _state_id(self, symbol):
+        """Dense state id for symbol; ids are stable for the lifetime of the algorithm."""
+        i = self._ids.get(symbol)
+        if i is None:
+            i = len(self._ids)
+            if i >= self._entry.size:
+                for name, dtype, fill in self._SOA_FIELDS:
+                    old = getattr(self, name)
+                    grown = np.full((2 * old.shape[0],) + old.shape[1:], fill, dtype=dtype)
+                    grown[:old.shape[0]] = old
+                    setattr(self, name, grown)
+            self._ids[symbol] = i
+        return i
+
+    def _warm_atr(self, added):
+        """Seed ATR for newly added securities from one batched daily history request."""
+        self._flush_daily_bars()
+        ids = np.fromiter((sec.sid for sec in added), dtype=np.intp, count=len(added))
+        for name, _, fill in self._ATR_FIELDS:
+            getattr(self, name)[ids] = fill
+
+        depth = self._indicator_period + 1
+        raw = self.history([sec.symbol for sec in added], depth, Resolution.DAILY)
+        if raw.empty:
+            return
+        codes = np.asarray(raw.index.codes[0])
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        hlc = raw[['high', 'low', 'close']].to_numpy(dtype=np.float64)[order]
+        times = raw.index.get_level_values(1)[order]
+
+        # right-align each symbol's last `depth` bars into (N, depth), NaN-padded on the left
+        uniq, starts, counts = np.unique(codes, return_index=True, return_counts=True)
+        ends = starts + counts
+        take = np.minimum(counts, depth)
+        grid = np.full((3, uniq.size, depth), np.nan)
+        for g in range(uniq.size):
+            grid[:, g, depth - take[g]:] = hlc[ends[g] - take[g]:ends[g]].T
+        atr, samples = warm_atr(grid[0], grid[1], grid[2], self._indicator_period)
+
+        for g, sym in enumerate(raw.index.levels[0][uniq]):
+            i = self._ids.get(sym)
+            if i is None:
+                continue
+            self._atr[i] = atr[g]
+            self._atr_n[i] = samples[g]
+            self._prev_close[i] = grid[2, g, -1]
+            self._atr_time[i] = times[ends[g] - 1].to_pydatetime().timestamp()
 
     # ---------- QC entrypoints ----------
     def initialize(self):
         self.set_start_date(2024, 1, 1)
         # self.set_end_date(2024, 2, 1)
         self.set_cash(10_000_000)
-        self.settings.automatic_indicator_warm_up = True
-        self._selected = []
-
-        # --- Parameters (with defaults) ---
-        self._universe_size             = self._p_int  ("universe-size",              1000)
-        self._indicator_period          = self._p_int  ("indicator-period",              14)   # days
-        self._stop_loss_atr_distance    = self._p_float("stop-loss-atr-distance",      0.5)   # ATR multiple
-        self._stop_loss_risk_size       = self._p_float("stop-loss-risk-size",        0.01)   # risk fraction if SL hits
-        self._max_positions             = self._p_int  ("max-positions",                 8)
-        self._opening_range_minutes     = self._p_int  ("opening-range-minutes",         5)
-        self._entry_buffer_atr          = self._p_float("entry-buffer-atr",           0.10)   # buffer beyond OR level
-        self._leverage                  = self._p_float("leverage",                       4)
-        self._atr_price_floor           = self._p_float("atr-price-floor",            0.01)   # ATR/Price >= floor
-        self._breakeven_trigger_R       = self._p_float("breakeven-trigger-R",         1.0)   # move SL to entry after +R
-        self._time_stop_hhmm            = self._p_hhmm ("time-stop-hhmm",           (10,45))  # e.g., "10:45"
-        self._trail_ATR_mult            = self._p_float("trail-ATR-mult",             1.5)    # trailing distance in ATRs AFTER breakeven
-        self._margin_buffer             = self._p_float("margin-buffer",              0.90)
-        self._retry_fraction            = self._p_float("retry-fraction",             0.50)
-        self._trail_update_threshold_atr= self._p_float("trail-update-threshold-atr", 0.25)   # throttle threshold
-        self._trail_min_ticks           = self._p_int  ("trail-min-ticks",               2)
-
-        # Optional filters (defaults for 3-param optimizer)
-        self._rvol_threshold            = self._p_float("rvol-threshold",              1.8)    # >1 == abnormally high
-        self._long_only                 = self._p_bool ("long-only",                  True)
-        self._gap_min_pct               = self._p_float("gap-min-pct",                 0.0)    # e.g., 1.0 = require 1% gap
+        self._selected = {}   # Symbol -> Security, insertion-ordered
+        self._invested = {}   # Symbol -> Security with an open position, maintained from fills
+
+        # --- Parameters (with defaults, see PARAMS) ---
+        self._load_parameters()
+
+        self._init_state(max(64, 2 * self._universe_size))
+        self._daily_queue = []  # (sid, end timestamp, high, low, close) awaiting _flush_daily_bars
+        self._or_start = self._or_end = self._or_folded = None
 
         # Optional: realistic brokerage model/slippage
         # self.set_brokerage_model(BrokerageName.InteractiveBrokers, AccountType.Margin)
 
         self._spy = self.add_equity('SPY').symbol
 
-        self.universe_settings.resolution = Resolution.DAILY
+        # Minute data for the whole universe: the opening range is captured live in on_data
+        self.universe_settings.resolution = Resolution.MINUTE
+        self.universe_settings.leverage = self._leverage
         self.universe_settings.schedule.on(self.date_rules.month_start(self._spy))
-        self._universe = self.add_universe(
-            lambda fundamentals: [
-                f.symbol for f in sorted(
-                    [f for f in fundamentals if f.price > 5 and f.symbol != self._spy],
-                    key=lambda f: f.dollar_volume
-                )[-self._universe_size:]
-            ]
-        )
+        self._universe = self.add_universe(self._select_universe)
 
+        self.schedule.on(self.date_rules.every_day(self._spy),
+                         self.time_rules.after_market_open(self._spy, 0),
+                         self._reset_opening_range)
         self.schedule.on(self.date_rules.every_day(self._spy),
                          self.time_rules.after_market_open(self._spy, self._opening_range_minutes),
                          self._scan_for_entries)
@@ -114,153 +270,202 @@ class OpeningRangeBreakoutUniverseAlgorithm(QCAlgorithm):
         self.set_warm_up(timedelta(days=2 * self._indicator_period))
 
     def on_securities_changed(self, changes):
-        for sec in changes.added_securities:
-            sec.atr = self.atr(sec.symbol, self._indicator_period, resolution=Resolution.DAILY)
-            sec.volume_sma = SimpleMovingAverage(self._indicator_period)
+        added = list(changes.added_securities)
+        for sec in added:
+            # daily bars feed ATR and the prior close
+            sec.daily_consolidator = self.consolidate(sec.symbol, Resolution.DAILY, self._on_daily_bar)
             # state
+            sec.sid = self._state_id(sec.symbol)
+            if sec.leverage != self._leverage:
+                sec.set_leverage(self._leverage)
+            tick = float(sec.symbol_properties.minimum_price_variation or 0.01)
+            self._tick[sec.sid] = tick if tick > 0 else 0.01
             self._reset_tickets(sec)
+        if added:
+            ids = np.fromiter((sec.sid for sec in added), dtype=np.intp, count=len(added))
+            for name, _, fill in self._VOL_FIELDS:
+                getattr(self, name)[ids] = fill
+            self._warm_atr(added)
+        for sec in changes.removed_securities:
+            consolidator = getattr(sec, "daily_consolidator", None)
+            if consolidator is not None:
+                self.subscription_manager.remove_consolidator(sec.symbol, consolidator)
+                sec.daily_consolidator = None
+
+    def _on_daily_bar(self, bar):
+        # Queue only; the whole day's bars are folded into ATR in one kernel call (_flush_daily_bars)
+        self._daily_queue.append((self._ids[bar.symbol], bar.end_time.timestamp(),
+                                  float(bar.high), float(bar.low), float(bar.close)))
+
+    def _flush_daily_bars(self):
+        """Fold queued daily bars into the ATR state before anything reads it."""
+        if not self._daily_queue:
+            return
+        q = self._daily_queue
+        self._daily_queue = []
+        fold_daily_bars(np.fromiter((b[0] for b in q), dtype=np.int64, count=len(q)),
+                        np.fromiter((b[1] for b in q), dtype=np.float64, count=len(q)),
+                        np.fromiter((b[2] for b in q), dtype=np.float64, count=len(q)),
+                        np.fromiter((b[3] for b in q), dtype=np.float64, count=len(q)),
+                        np.fromiter((b[4] for b in q), dtype=np.float64, count=len(q)),
+                        self._atr, self._atr_n, self._prev_close, self._atr_time, self._indicator_period)
+
+    def _select_universe(self, fundamentals):
+        # Top-N by dollar volume: O(n) partition instead of a full sort (order within the top-N is irrelevant)
+        symbols, dollar_volume = [], []
+        for f in fundamentals:
+            if f.price > 5 and f.symbol != self._spy:
+                symbols.append(f.symbol)
+                dollar_volume.append(f.dollar_volume)
+        dollar_volume = np.asarray(dollar_volume, dtype=np.float64)
+        k = self._universe_size
+        if dollar_volume.size <= k:
+            return symbols
+        idx = np.argpartition(dollar_volume, -k)[-k:]
+        return [symbols[i] for i in idx]
+
+    # ---------- opening range capture ----------
+    def _reset_opening_range(self):
+        for name, _, fill in self._OR_FIELDS:
+            getattr(self, name).fill(fill)
+        self._or_start = self.time
+        self._or_end = self.time + timedelta(minutes=self._opening_range_minutes)
+        self._or_folded = None
+
+    def _fold_opening_range(self, data):
+        # Fold this slice's minute bars into the OR aggregates while inside the opening window (once per time step)
+        if self._or_start is None or not (self._or_start < self.time <= self._or_end) or self._or_folded == self.time:
+            return
+        self._or_folded = self.time
+        bars = [b for b in data.bars.values() if b.symbol in self._ids]
+        if not bars:
+            return
+        n = len(bars)
+        ids = np.fromiter((self._ids[b.symbol] for b in bars), dtype=np.intp, count=n)
+        o = np.fromiter((b.open for b in bars), dtype=np.float64, count=n)
+        first = self._or_count[ids] == 0
+        self._or_open[ids[first]] = o[first]
+        np.maximum.at(self._or_high, ids, np.fromiter((b.high for b in bars), dtype=np.float64, count=n))
+        np.minimum.at(self._or_low, ids, np.fromiter((b.low for b in bars), dtype=np.float64, count=n))
+        self._or_close[ids] = np.fromiter((b.close for b in bars), dtype=np.float64, count=n)
+        np.add.at(self._or_vol, ids, np.fromiter((b.volume for b in bars), dtype=np.float64, count=n))
+        np.add.at(self._or_count, ids, 1)
 
     # ---------- core logic ----------
     def _scan_for_entries(self):
         symbols = list(self._universe.selected)
         if not symbols:
             return
+        period, max_pos = self._indicator_period, self._max_positions
+        buffer_atr, sl_atr = self._entry_buffer_atr, self._stop_loss_atr_distance
 
-        equities = [self.securities[s] for s in symbols]
-
-        # Minute data: request 6 and take last 5 => robust 09:30–09:34 for OR
-        raw = self.history(symbols, self._opening_range_minutes + 1, Resolution.MINUTE)
-        if raw.empty:
-            return
+        # OR aggregates (first open, max high, min low, last close, sum volume) captured live in on_data;
+        # the scan can fire before on_data for the last OR bar, so fold the current slice first
+        self._fold_opening_range(self.current_slice)
+        self._flush_daily_bars()
+        or_open, or_high, or_low, or_close, or_vol = self._or_open, self._or_high, self._or_low, self._or_close, self._or_vol
 
-        minute_tail = raw.tail(self._opening_range_minutes)  # last 5 rows (global tail)
-        vol_df = minute_tail.volume.unstack(0)
-        if vol_df.empty:
+        equities = [self.securities[s] for s in symbols]
+        equities = [e for e in equities if self._or_count[e.sid] > 0]
+        if not equities:
             return
-        volume_sum = vol_df.sum()
 
-        equities = [e for e in equities if e.symbol in volume_sum.index]
+        # First-5m RVOL against the SMA of prior days (NaN until indicator-period sessions are seen),
+        # then push today's first-5m vol into the circular buffer
+        ids = np.fromiter((e.sid for e in equities), dtype=np.intp, count=len(equities))
+        first5_vol = or_vol[ids]
+        sma = self._vol_sum[ids] / period
+        rvol = np.where((self._vol_n[ids] >= period) & (sma > 0), first5_vol / np.maximum(sma, 1e-12), np.nan)
 
-        # First-5m RVOL baseline (SMA over prior days) and compute today's first-5m vol
-        for e in equities:
-            first5_vol = float(volume_sum.loc[e.symbol])
-            if e.volume_sma is not None:
-                e.relative_volume = (first5_vol / e.volume_sma.current.value) if e.volume_sma.is_ready else None
-                e.volume_sma.update(self.time, first5_vol)
-            else:
-                e.relative_volume = None
+        pos = self._vol_pos[ids]
+        self._vol_sum[ids] += first5_vol - self._vol_buf[ids, pos]
+        self._vol_buf[ids, pos] = first5_vol
+        self._vol_pos[ids] = (pos + 1) % period
+        self._vol_n[ids] = np.minimum(self._vol_n[ids] + 1, period)
 
         if self.is_warming_up:
             return
 
-        # Filter by RVOL parameter
-        equities = [e for e in equities if (e.relative_volume is not None and e.relative_volume > self._rvol_threshold)]
-        if not equities:
+        # Filter by RVOL parameter, keep the highest max-positions (ascending, stable like sorted())
+        keep = np.flatnonzero(rvol > self._rvol_threshold)
+        if keep.size == 0:
             return
-
-        equities = sorted(equities, key=lambda e: e.relative_volume)[-self._max_positions:]
-
-        # Opening range prices from same window
-        open_df  = minute_tail.open.unstack(0)
-        close_df = minute_tail.close.unstack(0)
-        high_df  = minute_tail.high.unstack(0)
-        low_df   = minute_tail.low.unstack(0)
-
-        open_by_symbol  = open_df.iloc[0]
-        close_by_symbol = close_df.iloc[-1]
-        high_by_symbol  = high_df.max()
-        low_by_symbol   = low_df.min()
-
-        # Optional: gap filter (|today open - prior close| >= X%)
-        prev_close_by_symbol = None
-        if self._gap_min_pct > 0:
-            try:
-                d_hist = self.history([e.symbol for e in equities], 2, Resolution.DAILY)
-                if not d_hist.empty and len(d_hist.index.get_level_values(0).unique()) >= 1:
-                    prev_close_by_symbol = d_hist.close.unstack(0).iloc[-2]
-            except:
-                prev_close_by_symbol = None  # best-effort
-
-        def gap_passes(sym) -> bool:
-            if self._gap_min_pct <= 0 or prev_close_by_symbol is None:
-                return True
-            try:
-                prev_c = float(prev_close_by_symbol.loc[sym])
-                today_o = float(open_by_symbol.loc[sym])
-                if prev_c <= 0: return True
-                gap_pct = abs(today_o - prev_c) / prev_c * 100.0
-                return gap_pct >= self._gap_min_pct
-            except:
-                return True  # do not over-filter if we lack data
-
-        orders = []
-
+        keep = keep[np.argsort(rvol[keep], kind="stable")][-max_pos:]
+        equities = [equities[j] for j in keep]
+
+        # Aligned candidate arrays: one boolean mask per side instead of per-symbol checks
+        ids   = ids[keep]
+        o_arr, c_arr = or_open[ids], or_close[ids]
+        h_arr, l_arr = or_high[ids], or_low[ids]
+        px_arr  = np.fromiter((e.price for e in equities), dtype=np.float64, count=len(equities))
+        atr_arr = np.where(self._atr_n[ids] >= period, self._atr[ids], np.nan)
+        # Optional: gap filter (|today open - prior close| >= X%); passes when the prior close is unknown
+        prev_c  = self._prev_close[ids]
+        gap_pct = np.abs(o_arr - prev_c) / np.maximum(prev_c, 1e-12) * 100.0
+        gap_ok  = (self._gap_min_pct <= 0) | ~(prev_c > 0) | (gap_pct >= self._gap_min_pct)
+        tradable = (px_arr > 0) & (atr_arr / np.maximum(px_arr, 1e-12) >= self._atr_price_floor) & gap_ok
+
+        # Orders as parallel arrays: candidate index, entry, stop, direction (longs first, then shorts)
         # LONGS (only if OR close up)
-        for sym in close_by_symbol[close_by_symbol > open_by_symbol].index:
-            e = self.securities[sym]
-            if not e.atr.is_ready: continue
-            if e.Price <= 0 or (e.atr.current.value / e.Price) < self._atr_price_floor: continue
-            if not gap_passes(sym): continue
-            entry = float(high_by_symbol.loc[sym]) + self._entry_buffer_atr * float(e.atr.current.value)
-            stop  = entry - self._stop_loss_atr_distance * float(e.atr.current.value)
-            orders.append({'equity': e, 'entry_price': entry, 'stop_price': stop, 'dir': +1})
+        long_idx = np.flatnonzero((c_arr > o_arr) & tradable)
+        long_entry = h_arr[long_idx] + buffer_atr * atr_arr[long_idx]
+        long_stop  = long_entry - sl_atr * atr_arr[long_idx]
+        sel, entry, stop, dirs = [long_idx], [long_entry], [long_stop], [np.ones(long_idx.size, dtype=np.int64)]
 
         # SHORTS (only if OR close down AND not long-only)
         if not self._long_only:
-            for sym in close_by_symbol[close_by_symbol < open_by_symbol].index:
-                e = self.securities[sym]
-                if not e.atr.is_ready: continue
-                if e.Price <= 0 or (e.atr.current.value / e.Price) < self._atr_price_floor: continue
-                if not gap_passes(sym): continue
-                entry = float(low_by_symbol.loc[sym]) - self._entry_buffer_atr * float(e.atr.current.value)
-                stop  = entry + self._stop_loss_atr_distance * float(e.atr.current.value)
-                orders.append({'equity': e, 'entry_price': entry, 'stop_price': stop, 'dir': -1})
-
-        total_orders = len(orders)
+            short_idx = np.flatnonzero((c_arr < o_arr) & tradable)
+            short_entry = l_arr[short_idx] - buffer_atr * atr_arr[short_idx]
+            short_stop  = short_entry + sl_atr * atr_arr[short_idx]
+            sel.append(short_idx)
+            entry.append(short_entry)
+            stop.append(short_stop)
+            dirs.append(-np.ones(short_idx.size, dtype=np.int64))
+
+        sel, entry, stop, dirs = np.concatenate(sel), np.concatenate(entry), np.concatenate(stop), np.concatenate(dirs)
+        total_orders = sel.size
         if total_orders == 0:
             return
 
-        for i, o in enumerate(orders, start=1):
-            e = o['equity']
-            if e not in self._selected:
-                self._selected.append(e)
+        equities = [equities[j] for j in sel]
+        for e in equities:
+            if e.symbol not in self._selected:
+                self._selected[e.symbol] = e
             self._reset_tickets(e)
 
-            # Ensure minute data during session and desired leverage
-            self.add_security(e.symbol, resolution=Resolution.MINUTE, leverage=self._leverage)
-
-            # --- position sizing: risk-based ---
-            risk_per_pos = (self._stop_loss_risk_size * self.portfolio.total_portfolio_value) / self._max_positions
-            denom = max(abs(o['entry_price'] - o['stop_price']), 1e-6)
-            risk_qty = risk_per_pos / denom
-            sign = 1 if o['dir'] > 0 else -1
-            risk_qty = int(risk_qty) * sign
-
-            # --- cap by allocation ---
-            alloc_cap = 1 / self._max_positions
-            limit_qty = abs(int(self.calculate_order_quantity(e.symbol, alloc_cap)))
-            qty = int(min(abs(risk_qty), limit_qty)) * (1 if risk_qty > 0 else -1)
-
-            # --- cap by remaining margin (prevent rejections) ---
-            free_margin = float(self.portfolio.margin_remaining)
-            remaining_orders = total_orders - (i - 1)
-            per_order_margin = (free_margin * self._margin_buffer) / max(1, remaining_orders)
-            lev = float(self.securities[e.symbol].Leverage or 1.0)
-            price = float(o['entry_price'])
-            max_qty_by_margin = int(max(0, (per_order_margin * lev) / max(price, 1e-6)))
-            qty = int(min(abs(qty), max_qty_by_margin)) * (1 if qty > 0 else -1)
+        # --- sizing for all orders at once; portfolio state is read once ---
+        total_pv    = float(self.portfolio.total_portfolio_value)
+        free_margin = float(self.portfolio.margin_remaining)
+        price = px_arr[sel]
+        lev   = np.array([e.leverage or 1.0 for e in equities], dtype=np.float64)
+
+        # risk-based: a hit of the initial stop loses risk_per_pos
+        risk_per_pos = (self._stop_loss_risk_size * total_pv) / max_pos
+        risk_qty = (risk_per_pos / np.maximum(np.abs(entry - stop), 1e-6)).astype(np.int64)
 
+        # cap by allocation: 1/max_positions of portfolio value at the current price
+        alloc_qty = (total_pv / max_pos / np.maximum(price, 1e-6)).astype(np.int64)
+
+        # cap by remaining margin (prevent rejections), spread over the orders still to place
+        remaining_orders = total_orders - np.arange(total_orders)
+        per_order_margin = (free_margin * self._margin_buffer) / remaining_orders
+        margin_qty = np.maximum(0.0, per_order_margin * lev / np.maximum(entry, 1e-6)).astype(np.int64)
+
+        quantities = np.minimum(np.minimum(risk_qty, alloc_qty), margin_qty) * dirs
+
+        retry_fraction = self._retry_fraction
+        for e, entry_price, stop_price, qty in zip(equities, entry.tolist(), stop.tolist(), quantities.tolist()):
             if qty == 0:
                 continue
 
             # submit with 50% retry on exception
-            e.initial_stop = float(o['stop_price'])
+            e.initial_stop = stop_price
             try:
-                e.entry_ticket = self.stop_market_order(e.symbol, qty, float(o['entry_price']), tag='Entry')
+                e.entry_ticket = self.stop_market_order(e.symbol, qty, entry_price, tag='Entry')
             except Exception:
-                smaller = int(abs(qty) * self._retry_fraction) * (1 if qty > 0 else -1)
+                smaller = int(abs(qty) * retry_fraction) * (1 if qty > 0 else -1)
                 if smaller != 0:
-                    e.entry_ticket = self.stop_market_order(e.symbol, smaller, float(o['entry_price']), tag='Entry_Retry50')
+                    e.entry_ticket = self.stop_market_order(e.symbol, smaller, entry_price, tag='Entry_Retry50')
                 else:
                     self._reset_tickets(e)
                     continue
@@ -270,24 +475,34 @@ class OpeningRangeBreakoutUniverseAlgorithm(QCAlgorithm):
             return
         sec = self.securities[order_event.symbol]
 
+        # keep the invested book in sync with every fill (entries, stops, TPs, liquidations)
+        if self.portfolio[order_event.symbol].invested:
+            self._invested[order_event.symbol] = sec
+        else:
+            self._invested.pop(order_event.symbol, None)
+
         # Entry filled -> arm SL, place TP(50%) if size>=2
         if sec.entry_ticket and order_event.order_id == sec.entry_ticket.order_id:
-            sec.entry_price = float(order_event.fill_price)
+            i = sec.sid
+            entry_price = float(order_event.fill_price)
+            direction = 1 if sec.entry_ticket.quantity > 0 else -1
             if sec.initial_stop is None:
-                direction = 1 if sec.entry_ticket.quantity > 0 else -1
-                sec.initial_stop = sec.entry_price - direction * self._stop_loss_atr_distance * float(sec.atr.current.value)
-            sec.oneR = abs(sec.entry_price - float(sec.initial_stop))
-            sec.moved_to_breakeven = False
+                sec.initial_stop = entry_price - direction * self._stop_loss_atr_distance * float(self._atr[i])
+            oneR = abs(entry_price - float(sec.initial_stop))
+            self._entry[i] = entry_price
+            self._dir[i] = direction
+            self._oneR[i] = oneR
+            self._moved_be[i] = False
+            self._hw[i] = entry_price
+            self._lw[i] = entry_price
             sec.entry_time = self.time
-            sec.high_water = sec.entry_price
-            sec.low_water = sec.entry_price
 
             # Arm stop for full size
-            sec.current_stop = float(sec.initial_stop)
+            self._stop[i] = float(sec.initial_stop)
             sec.stop_loss_ticket = self.stop_market_order(
                 order_event.symbol,
                 -sec.entry_ticket.quantity,
-                sec.current_stop,
+                float(sec.initial_stop),
                 tag='ATR Stop'
             )
 
@@ -295,8 +510,8 @@ class OpeningRangeBreakoutUniverseAlgorithm(QCAlgorithm):
             abs_qty = abs(sec.entry_ticket.quantity)
             half = abs_qty // 2
             if half >= 1:
-                tp_qty = -half if sec.entry_ticket.quantity > 0 else half
-                tp_price = sec.entry_price + sec.oneR if sec.entry_ticket.quantity > 0 else sec.entry_price - sec.oneR
+                tp_qty = -direction * half
+                tp_price = entry_price + direction * oneR
                 sec.half_qty = half
                 sec.tp_ticket = self.limit_order(order_event.symbol, tp_qty, float(tp_price), tag='TakeProfit_1R')
 
@@ -311,88 +526,88 @@ class OpeningRangeBreakoutUniverseAlgorithm(QCAlgorithm):
             remaining = self.portfolio[order_event.symbol].quantity
             if sec.stop_loss_ticket and self.portfolio[order_event.symbol].invested:
                 sec.stop_loss_ticket.UpdateQuantity(-remaining, "")
-            if sec.entry_price is not None and sec.stop_loss_ticket:
-                sec.stop_loss_ticket.UpdateStopPrice(float(sec.entry_price), "")
-                sec.current_stop = float(sec.entry_price)
-                sec.moved_to_breakeven = True
-                sec.last_stop_update_time = self.time
+            i = sec.sid
+            if not np.isnan(self._entry[i]) and sec.stop_loss_ticket:
+                entry_price = float(self._entry[i])
+                sec.stop_loss_ticket.UpdateStopPrice(entry_price, "")
+                self._stop[i] = entry_price
+                self._moved_be[i] = True
+                self._last_upd[i] = self.time.timestamp()
 
     # ---------- throttling helper ----------
-    def _should_move_stop(self, sec, new_price: float) -> bool:
-        if new_price is None:
-            return False
-        if getattr(sec, "current_stop", None) is None:
-            return True
-        if getattr(sec, "last_stop_update_time", None) == self.time:
-            return False
-        if not sec.atr.is_ready:
-            return False
-        atr = float(sec.atr.current.value)
-        if atr <= 0:
-            return False
-        # Use self.securities[...] (not self.Securities) for Python API
-        sp = self.securities[sec.symbol].symbol_properties
-        tick = getattr(sp, "minimum_price_variation", None) or 0.01
-        if tick <= 0:
-            tick = 0.01
-        if abs(new_price - sec.current_stop) < max(self._trail_min_ticks * tick, self._trail_update_threshold_atr * atr):
-            return False
-        return True
+    @staticmethod
+    def _should_move_stops(new_ticks, stop_ticks, last_upd, threshold_ticks, atr_ok, now):
+        """Vectorized stop-update throttle on the tick grid: move only if |change| >= threshold ticks, at most once per bar."""
+        return np.isnan(stop_ticks) | ((last_upd != now) & atr_ok & ~(np.abs(new_ticks - stop_ticks) < threshold_ticks))
 
     def on_data(self, data: Slice):
-        # Breakeven at +1R and ATR trailing after breakeven (with throttling).
-        for e in list(self._selected):
-            if not self.portfolio[e.symbol].invested:
-                continue
-            if not (e.entry_ticket and e.stop_loss_ticket and e.oneR and e.entry_price is not None):
-                continue
+        self._fold_opening_range(data)
+        self._flush_daily_bars()
 
-            price = float(e.price)
-            qty = self.portfolio[e.symbol].quantity
-            if qty == 0:
-                continue
-            direction = 1 if qty > 0 else -1
-
-            # track high/low water
-            if e.high_water is None: e.high_water = price
-            if e.low_water  is None: e.low_water  = price
-            e.high_water = max(e.high_water, price) if direction > 0 else e.high_water
-            e.low_water  = min(e.low_water,  price) if direction < 0 else e.low_water
-
-            move = direction * (price - e.entry_price)
-
-            # 1) Breakeven when +R achieved (if not already)
-            if (not e.moved_to_breakeven) and (move >= self._breakeven_trigger_R * e.oneR):
-                if self._should_move_stop(e, float(e.entry_price)):
-                    e.stop_loss_ticket.UpdateStopPrice(float(e.entry_price), "")
-                    e.current_stop = float(e.entry_price)
-                    e.moved_to_breakeven = True
-                    e.last_stop_update_time = self.time
-
-            # 2) ATR trailing AFTER breakeven
-            if e.moved_to_breakeven and e.atr.is_ready:
-                atr = float(e.atr.current.value)
-                if direction > 0:
-                    trail_candidate = max(e.entry_price, e.high_water - self._trail_ATR_mult * atr)
-                    if (e.current_stop is None or trail_candidate > e.current_stop) and self._should_move_stop(e, trail_candidate):
-                        e.stop_loss_ticket.UpdateStopPrice(float(trail_candidate), "")
-                        e.current_stop = float(trail_candidate)
-                        e.last_stop_update_time = self.time
-                else:
-                    trail_candidate = min(e.entry_price, e.low_water + self._trail_ATR_mult * atr)
-                    if (e.current_stop is None or trail_candidate < e.current_stop) and self._should_move_stop(e, trail_candidate):
-                        e.stop_loss_ticket.UpdateStopPrice(float(trail_candidate), "")
-                        e.current_stop = float(trail_candidate)
-                        e.last_stop_update_time = self.time
+        # Breakeven at +1R and ATR trailing after breakeven (with throttling), one vectorized pass over open positions.
+        active = [e for e in self._invested.values() if e.entry_ticket and e.stop_loss_ticket]
+        if not active:
+            return
+
+        trail_mult, be_R = self._trail_ATR_mult, self._breakeven_trigger_R
+        n = len(active)
+        ids  = np.fromiter((e.sid for e in active), dtype=np.intp, count=n)
+        px   = np.fromiter((e.price for e in active), dtype=np.float64, count=n)
+        now = self.time.timestamp()
+
+        # ATR and throttle threshold once per bar, in whole ticks: max(N ticks, ceil(k x ATR / tick))
+        atr = np.where(self._atr_n[ids] >= self._indicator_period, self._atr[ids], np.nan)
+        atr_ok = atr > 0
+        tick = self._tick[ids]
+        threshold_ticks = np.maximum(self._trail_min_ticks, np.ceil(self._trail_update_threshold_atr * atr / tick))
+        direction = self._dir[ids]
+        entry = self._entry[ids]
+        oneR = self._oneR[ids]
+        stop = self._stop[ids]
+        last_upd = self._last_upd[ids]
+        moved = self._moved_be[ids]
+        live = (oneR > 0) & ~np.isnan(entry)
+        long_ = direction > 0
+
+        # track high/low water
+        hw = np.where(long_, np.fmax(self._hw[ids], px), self._hw[ids])
+        lw = np.where(~long_, np.fmin(self._lw[ids], px), self._lw[ids])
+
+        # 1) Breakeven when +R achieved (if not already)
+        move = direction * (px - entry)
+        be = live & ~moved & (move >= be_R * oneR)
+        be &= self._should_move_stops(np.rint(entry / tick), np.rint(stop / tick), last_upd, threshold_ticks, atr_ok, now)
+        stop[be] = entry[be]
+        moved |= be
+        last_upd[be] = now
+
+        # 2) ATR trailing AFTER breakeven
+        trail_candidate = np.where(long_,
+                                   np.maximum(entry, hw - trail_mult * atr),
+                                   np.minimum(entry, lw + trail_mult * atr))
+        better = np.isnan(stop) | np.where(long_, trail_candidate > stop, trail_candidate < stop)
+        trail = live & moved & ~np.isnan(atr) & better
+        trail &= self._should_move_stops(np.rint(trail_candidate / tick), np.rint(stop / tick), last_upd, threshold_ticks, atr_ok, now)
+        stop[trail] = trail_candidate[trail]
+        last_upd[trail] = now
+
+        self._hw[ids] = hw
+        self._lw[ids] = lw
+        self._stop[ids] = stop
+        self._last_upd[ids] = last_upd
+        self._moved_be[ids] = moved
+
+        # only the positions whose stop actually moved touch the order API
+        for j in np.flatnonzero(be | trail).tolist():
+            active[j].stop_loss_ticket.UpdateStopPrice(float(stop[j]), "")
 
     def _time_stop_exit(self):
         # At 10:45 ET by default, flatten positions opened today that haven't reached +1R (not at breakeven yet).
-        for e in list(self._selected):
-            if not self.portfolio[e.symbol].invested:
-                continue
-            if e.entry_time is None or e.entry_time.date() != self.time.date():
+        today = self.time.date()
+        for e in list(self._invested.values()):
+            if e.entry_time is None or e.entry_time.date() != today:
                 continue
-            if not e.moved_to_breakeven:
+            if not self._moved_be[e.sid]:
                 self.liquidate(e.symbol)
 
     # ---------- housekeeping ----------
@@ -400,20 +615,14 @@ class OpeningRangeBreakoutUniverseAlgorithm(QCAlgorithm):
         sec.entry_ticket = None
         sec.stop_loss_ticket = None
         sec.tp_ticket = None
-        sec.entry_price = None
         sec.initial_stop = None
-        sec.current_stop = None
-        sec.oneR = None
-        sec.moved_to_breakeven = False
         sec.entry_time = None
         sec.half_qty = 0
-        sec.high_water = None
-        sec.low_water = None
-        sec.last_stop_update_time = None
+        for name, _, fill in self._STATE_FIELDS:
+            getattr(self, name)[sec.sid] = fill
 
     def _exit(self):
         self.liquidate()
-        for e in self._selected:
+        for e in self._selected.values():
             self._reset_tickets(e)
-            self.remove_security(e.symbol)
-        self._selected = []
+        self._selected.clear()
@@ -52,6 +52,7 @@ Key parameters (via self.get_parameter)
 - leverage (float): target leverage for equity subscriptions (used in BP checks)
 - margin-buffer (float): keep some margin free during multi-order mornings (e.g., 0.90)
 - retry-fraction (float): if an order is rejected, retry at a smaller fraction (e.g., 0.5)
+- min-stop-bars (int): minimum bars between trailing stop updates (default 0 = once-per-bar throttle only)
 
 Options-specific parameters
 - use-options (bool): enable options execution mode
@@ -64,7 +65,8 @@ Options-specific parameters
 - confirm-mode (str): “close” (implemented) or “retest” (placeholder uses “close” behavior)
 
 Intraday management & throttling (to avoid message flood)
-- Stop updates are throttled: only update if price change ≥ max( N ticks, threshold × ATR ) and no more than once per bar.
+- Stop updates are throttled: only update if price change ≥ max( N ticks, threshold × ATR ) and no more than once per bar
+  (trailing updates additionally wait `min-stop-bars` bars after the last stop move).
 - Minimal/noisy order tags are suppressed for quiet logs.
 - Time-stop flattens positions not at breakeven by a set time.
 
@@ -82,28 +84,116 @@ Optimizer note (QC’s 3-parameter limit)
 
 # region imports
 from AlgorithmImports import *
+import heapq
 import math
+import operator
+import numpy as np
+import pandas as pd
+from numba import njit
 # endregion
 
+@njit("Tuple((f8, i8, i8))(f8[:], i8, i8, f8)", cache=True)
+def sma_update(ring, i, n, value):
+    """Ring-buffer SMA step -> (mean of the ring BEFORE value, NaN until full; next index; count)."""
+    period = ring.size
+    mean = ring.sum() / period if n >= period else np.nan
+    ring[i] = value
+    return mean, (i + 1) % period, min(n + 1, period)
+
+def _attr_getter(probe, *names):
+    """attrgetter for the first of names that probe has (property names differ across QC versions)."""
+    for name in names:
+        if hasattr(probe, name):
+            return operator.attrgetter(name)
+    return lambda c: None
+
+@njit("void(f8[:], i8[:], f8[:], f8[:], f8[:], f8[:], f8[:], f8[:], b1[:], b1[:], f8[:], f8, f8, b1[:])", cache=True)
+def trail_stops(px, dirn, entry, hw, lw, atr, oneR, stop, moved, updated, thr, be_R, trail_mult, hit):
+    """In-place breakeven / ATR-trail step per position (NaN = unset); hit[i] set when px crossed the stop.
+
+    updated[i]: on entry, the stop already moved this bar (throttle); on exit, the stop moved this bar.
+    thr[i] is the throttle distance (_trail_threshold), NaN while ATR is not usable.
+    """
+    for i in range(px.size):
+        p = px[i]
+        d = dirn[i]
+        # track extremes
+        if np.isnan(hw[i]):
+            hw[i] = p
+        if np.isnan(lw[i]):
+            lw[i] = p
+        if d > 0:
+            hw[i] = max(hw[i], p)
+        else:
+            lw[i] = min(lw[i], p)
+
+        # move to breakeven after +R
+        if not moved[i] and oneR[i] > 0 and d * (p - entry[i]) >= be_R * oneR[i]:
+            stop[i] = entry[i]
+            moved[i] = True
+            updated[i] = True
+
+        # trail after breakeven, throttled (see _should_move_stop)
+        if moved[i] and not np.isnan(atr[i]):
+            if d > 0:
+                cand = max(entry[i], hw[i] - trail_mult * atr[i])
+                better = np.isnan(stop[i]) or cand > stop[i]
+            else:
+                cand = min(entry[i], lw[i] + trail_mult * atr[i])
+                better = np.isnan(stop[i]) or cand < stop[i]
+            if better:
+                if np.isnan(stop[i]):
+                    move = True
+                elif updated[i] or np.isnan(thr[i]):
+                    move = False
+                else:
+                    move = abs(cand - stop[i]) >= thr[i]
+                if move:
+                    stop[i] = cand
+                    updated[i] = True
+
+        hit[i] = not np.isnan(stop[i]) and (p <= stop[i] if d > 0 else p >= stop[i])
+
+class _TradeState:
+    """Per-symbol trading state in plain slots, kept off the managed Security wrapper (see _state)."""
+    __slots__ = ('sec', 'symbol', 'tick_size', 'holding',
+                 # indicators (equities only)
+                 'atr', 'vol_ring', 'vol_ring_i', 'vol_ring_n', 'daily_window', 'daily_consolidator',
+                 # options mode: pending entry and open legs
+                 'pending_dir', 'pending_right', 'pending_entry', 'pending_stop', 'confirm_count', 'confirm_ready_time',
+                 'option_long', 'option_short', 'option_qty', 'long_holding', 'short_holding', 'option_has_pos',
+                 # equity mode tickets and trade tracking (see _reset_tickets)
+                 'entry_ticket', 'stop_loss_ticket', 'tp_ticket', 'entry_price', 'initial_stop', 'current_stop',
+                 'oneR', 'moved_to_breakeven', 'entry_time', 'half_qty', 'high_water', 'low_water',
+                 'last_stop_update_time', 'bars_since_stop_move', 'trail_threshold')
+
+    def __init__(self, sec, tick_size):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.sec = sec
+        self.symbol = sec.symbol
+        self.tick_size = tick_size
+        self.holding = sec.holdings  # same live SecurityHolding as portfolio[symbol]
+
 class OpeningRangeBreakoutUniverseOptions(QCAlgorithm):
 
-    # ---------- helpers: robust parameter parsing ----------
+    # ---------- helpers: robust parameter parsing (from self._params, read once in initialize) ----------
     def _p_str(self, name, default):
-        v = self.get_parameter(name)
+        v = self._params.get(name)
         return v if (v is not None and v != "") else default
 
     def _p_int(self, name, default):
-        v = self.get_parameter(name)
+        v = self._params.get(name)
         try:    return int(v) if v not in (None, "") else default
         except: return default
 
     def _p_float(self, name, default):
-        v = self.get_parameter(name)
+        v = self._params.get(name)
         try:    return float(v) if v not in (None, "") else default
         except: return default
 
     def _p_bool(self, name, default):
-        v = self.get_parameter(name)
+        v = self._params.get(name)
         if v is None or v == "": return default
         s = str(v).strip().lower()
         if s in ("1","true","t","yes","y","on"):  return True
@@ -112,7 +202,7 @@ class OpeningRangeBreakoutUniverseOptions(QCAlgorithm):
 
     def _p_hhmm(self, name, default_tuple):
         """Parse 'HH:MM' -> (HH,MM), else return default_tuple."""
-        v = self.get_parameter(name)
+        v = self._params.get(name)
         if not v or not isinstance(v, str):
             return default_tuple
         try:
@@ -128,11 +218,16 @@ class OpeningRangeBreakoutUniverseOptions(QCAlgorithm):
 
     # ---------- QC entrypoints ----------
     def initialize(self):
+        self._params = dict(self.get_parameters())  # one managed call instead of one per parameter
         self.set_start_date(2024, 1, 1)
         # self.set_end_date(2025, 7, 31)
         self.set_cash(10_000_000)
         self.settings.automatic_indicator_warm_up = True
-        self._selected = []
+        self._state = {}           # Symbol -> _TradeState, created when the security is added
+        self._selected = []        # _TradeState of symbols armed today
+        self._invested = {}        # Symbol -> _TradeState with an open position, maintained from fills
+        self._pending_confirmation = set()  # options mode: underlyings armed and awaiting confirmation
+        self._option_invested = set()       # options mode: underlyings with open option legs
         self._option_handles = {}  # underlying Symbol -> Option object
 
         # --- Core params (with defaults) ---
@@ -152,6 +247,7 @@ class OpeningRangeBreakoutUniverseOptions(QCAlgorithm):
         self._retry_fraction            = self._p_float("retry-fraction",             0.50)
         self._trail_update_threshold_atr= self._p_float("trail-update-threshold-atr", 0.25)
         self._trail_min_ticks           = self._p_int  ("trail-min-ticks",               2)
+        self._min_stop_bars             = self._p_int  ("min-stop-bars",                 0)
 
         # Filters / toggles (defaults suited for 3-param optimizer)
         self._rvol_threshold            = self._p_float("rvol-threshold",              1.8)
@@ -168,19 +264,26 @@ class OpeningRangeBreakoutUniverseOptions(QCAlgorithm):
         self._confirm_bars              = self._p_int  ("confirm-bars",                  1)
         self._confirm_mode              = self._p_str  ("confirm-mode",             "close")  # "close" or "retest" (close used)
 
+        # one option-chain filter shared by every underlying: near expiries, near-ATM strikes (we still hand-pick later)
+        self._option_filter = lambda u, dte_max=self._option_dte_max: u.expiration(0, dte_max).strikes(-3, +3)
+
         # Optional: realistic brokerage model/slippage
         # self.set_brokerage_model(BrokerageName.InteractiveBrokers, AccountType.Margin)
 
         self._spy = self.add_equity('SPY').symbol
 
-        self.universe_settings.resolution = Resolution.DAILY
+        # Minute data and target leverage for the whole universe, so entries need no per-order subscription change
+        self.universe_settings.resolution = Resolution.MINUTE
+        self.universe_settings.leverage = self._leverage
         self.universe_settings.schedule.on(self.date_rules.month_start(self._spy))
+        # top-N by dollar volume: O(n log k) heap selection instead of a full sort (order is irrelevant)
         self._universe = self.add_universe(
             lambda fundamentals: [
-                f.symbol for f in sorted(
-                    [f for f in fundamentals if f.price > 5 and f.symbol != self._spy],
+                f.symbol for f in heapq.nlargest(
+                    self._universe_size,
+                    (f for f in fundamentals if f.price > 5 and f.symbol != self._spy),
                     key=lambda f: f.dollar_volume
-                )[-self._universe_size:]
+                )
             ]
         )
 
@@ -198,20 +301,46 @@ class OpeningRangeBreakoutUniverseOptions(QCAlgorithm):
         self.set_warm_up(timedelta(days=2 * self._indicator_period))
 
     def on_securities_changed(self, changes):
+        seed = []
         for sec in changes.added_securities:
-            sec.atr = self.atr(sec.symbol, self._indicator_period, resolution=Resolution.DAILY)
-            sec.volume_sma = SimpleMovingAverage(self._indicator_period)
+            tick = float(getattr(sec.symbol_properties, "minimum_price_variation", 0.01) or 0.01)
+            # tick cached once; read on every bar by the stop throttle
+            st = self._state[sec.symbol] = _TradeState(sec, tick if tick > 0 else 0.01)
+            if sec.type == SecurityType.EQUITY:
+                st.atr = self.atr(sec.symbol, self._indicator_period, resolution=Resolution.DAILY)
+                # first-5m volume SMA: ring buffer advanced by sma_update
+                st.vol_ring = np.zeros(self._indicator_period, dtype=np.float64)
+                st.vol_ring_i = 0
+                st.vol_ring_n = 0
+                # last completed daily bar for the gap filter, kept current by a consolidator (no history call per scan)
+                st.daily_window = RollingWindow[TradeBar](1)
+                st.daily_consolidator = self.consolidate(sec.symbol, Resolution.DAILY,
+                                                         lambda bar, w=st.daily_window: w.add(bar))
+                seed.append(st)
             # state for equity mode:
-            self._reset_tickets(sec)
+            self._reset_tickets(st)
             # state for options mode:
-            sec.pending_dir = 0
-            sec.pending_entry = None
-            sec.pending_stop = None
-            sec.confirm_count = 0
-            sec.confirm_ready_time = None
-            sec.option_long = None
-            sec.option_short = None
-            sec.option_qty = 0
+            st.pending_dir = 0
+            st.confirm_count = 0
+            st.option_qty = 0
+            st.option_has_pos = False
+
+        # seed the prior close of newly added equities with one batched request per universe change
+        if seed and self._gap_min_pct > 0:
+            for bars in self.history[TradeBar]([st.symbol for st in seed], 1, Resolution.DAILY):
+                for sym, bar in bars.items():
+                    self._state[sym].daily_window.add(bar)
+
+        for sec in changes.removed_securities:
+            st = self._state.get(sec.symbol)
+            if st is None:
+                continue
+            if st.daily_consolidator is not None:
+                self.subscription_manager.remove_consolidator(sec.symbol, st.daily_consolidator)
+                st.daily_consolidator = None
+            # option contracts churn daily; equity state stays for symbols still referenced by the scan
+            if sec.type != SecurityType.EQUITY and sec.symbol not in self._invested:
+                del self._state[sec.symbol]
 
     # ---------- universe/ORB & entry preparation ----------
     def _scan_for_entries(self):
@@ -219,115 +348,100 @@ class OpeningRangeBreakoutUniverseOptions(QCAlgorithm):
         if not symbols:
             return
 
-        equities = [self.securities[s] for s in symbols]
+        equities = [self._state[s] for s in symbols if s in self._state]
 
         # Minute data: request 6 and take last 5 => robust 09:30–09:34 for OR
         raw = self.history(symbols, self._opening_range_minutes + 1, Resolution.MINUTE)
         if raw.empty:
             return
 
-        minute_tail = raw.tail(self._opening_range_minutes)
-        vol_df = minute_tail.volume.unstack(0)
-        if vol_df.empty:
+        # OR aggregates per symbol in one groupby (first open, last close, max high, min low, summed volume).
+        # History is symbol-major, so take the last N bars per symbol rather than a frame-wide tail.
+        minute_tail = raw.groupby(level=0).tail(self._opening_range_minutes)
+        or_agg = minute_tail.groupby(level=0).agg(open=('open', 'first'), close=('close', 'last'),
+                                                  high=('high', 'max'), low=('low', 'min'),
+                                                  vol_sum=('volume', 'sum'))
+        if or_agg.empty:
             return
-        volume_sum = vol_df.sum()
+        volume_sum = or_agg.vol_sum
 
         equities = [e for e in equities if e.symbol in volume_sum.index]
+        if not equities:
+            return
 
-        # RVOL baseline: SMA(14) of first-5-min volume
+        # RVOL baseline: SMA(14) of first-5-min volume, read before today's value is pushed.
+        # This is the only per-symbol pass: each symbol owns its ring buffer.
+        sma_now, atr_now, px_now = [], [], []
         for e in equities:
-            first5_vol = float(volume_sum.loc[e.symbol])
-            if e.volume_sma is not None:
-                e.relative_volume = (first5_vol / e.volume_sma.current.value) if e.volume_sma.is_ready else None
-                e.volume_sma.update(self.time, first5_vol)
-            else:
-                e.relative_volume = None
+            sma, e.vol_ring_i, e.vol_ring_n = sma_update(e.vol_ring, e.vol_ring_i, e.vol_ring_n, float(volume_sum[e.symbol]))
+            sma_now.append(sma)
+            atr_now.append(e.atr.current.value if e.atr.is_ready else np.nan)
+            px_now.append(e.sec.price)
 
         if self.is_warming_up:
             return
 
-        # Filter by RVOL
-        equities = [e for e in equities if (e.relative_volume is not None and e.relative_volume > self._rvol_threshold)]
-        if not equities:
+        # One row per candidate symbol; everything below is column arithmetic
+        index = pd.Index([e.symbol for e in equities])
+        df = or_agg.reindex(index)
+        df['atr']   = np.asarray(atr_now, dtype=float)
+        df['price'] = np.asarray(px_now, dtype=float)
+        sma = pd.Series(sma_now, index=index, dtype=float)
+        df['rvol']  = df.vol_sum / sma.where(sma > 0)
+
+        # Filter by RVOL and keep the top max-positions
+        df = df[df.rvol > self._rvol_threshold].nlargest(self._max_positions, 'rvol')
+        if df.empty:
             return
 
-        equities = sorted(equities, key=lambda e: e.relative_volume)[-self._max_positions:]
-
-        # OR prices from same window
-        open_df  = minute_tail.open.unstack(0)
-        close_df = minute_tail.close.unstack(0)
-        high_df  = minute_tail.high.unstack(0)
-        low_df   = minute_tail.low.unstack(0)
-
-        open_by_symbol  = open_df.iloc[0]
-        close_by_symbol = close_df.iloc[-1]
-        high_by_symbol  = high_df.max()
-        low_by_symbol   = low_df.min()
-
-        # Optional: gap filter
-        prev_close_by_symbol = None
+        # Optional: gap filter against the last completed session's close;
+        # passes when disabled or the prior close is unknown / non-positive
+        gap_ok = pd.Series(True, index=df.index)
         if self._gap_min_pct > 0:
-            try:
-                d_hist = self.history([e.symbol for e in equities], 2, Resolution.DAILY)
-                if not d_hist.empty and len(d_hist.index.get_level_values(0).unique()) >= 1:
-                    prev_close_by_symbol = d_hist.close.unstack(0).iloc[-2]
-            except:
-                prev_close_by_symbol = None
-
-        def gap_passes(sym) -> bool:
-            if self._gap_min_pct <= 0 or prev_close_by_symbol is None:
-                return True
-            try:
-                prev_c = float(prev_close_by_symbol.loc[sym])
-                today_o = float(open_by_symbol.loc[sym])
-                if prev_c <= 0: return True
-                gap_pct = abs(today_o - prev_c) / prev_c * 100.0
-                return gap_pct >= self._gap_min_pct
-            except:
-                return True
-
-        # Build desired orders
-        orders = []
-        # LONGS
-        for sym in close_by_symbol[close_by_symbol > open_by_symbol].index:
-            e = self.securities[sym]
-            if not e.atr.is_ready: continue
-            if e.Price <= 0 or (e.atr.current.value / e.Price) < self._atr_price_floor: continue
-            if not gap_passes(sym): continue
-            entry = float(high_by_symbol.loc[sym]) + self._entry_buffer_atr * float(e.atr.current.value)
-            stop  = entry - self._stop_loss_atr_distance * float(e.atr.current.value)
-            orders.append({'equity': e, 'entry_price': entry, 'stop_price': stop, 'dir': +1})
-
-        # SHORTS (if enabled)
-        if not self._long_only:
-            for sym in close_by_symbol[close_by_symbol < open_by_symbol].index:
-                e = self.securities[sym]
-                if not e.atr.is_ready: continue
-                if e.Price <= 0 or (e.atr.current.value / e.Price) < self._atr_price_floor: continue
-                if not gap_passes(sym): continue
-                entry = float(low_by_symbol.loc[sym]) - self._entry_buffer_atr * float(e.atr.current.value)
-                stop  = entry + self._stop_loss_atr_distance * float(e.atr.current.value)
-                orders.append({'equity': e, 'entry_price': entry, 'stop_price': stop, 'dir': -1})
+            windows = [self._state[sym].daily_window for sym in df.index]
+            prev_c = pd.Series([float(w[0].close) if w.count > 0 else np.nan for w in windows], index=df.index)
+            gap_pct = (df.open - prev_c).abs() / prev_c * 100.0
+            gap_ok = ~(prev_c > 0) | (gap_pct >= self._gap_min_pct)
+
+        tradable = df.atr.notna() & (df.price > 0) & (df.atr / df.price >= self._atr_price_floor) & gap_ok
+        long_mask  = tradable & (df.close > df.open)
+        short_mask = tradable & (df.close < df.open) & (not self._long_only)
+
+        # Desired orders as aligned arrays, LONGS then SHORTS (if enabled): entry beyond the OR level, stop behind it
+        long_, short_ = long_mask.to_numpy(), short_mask.to_numpy()
+        atr = df.atr.to_numpy()
+        entry_long  = df.high.to_numpy()[long_] + self._entry_buffer_atr * atr[long_]
+        entry_short = df.low.to_numpy()[short_] - self._entry_buffer_atr * atr[short_]
+        entry = np.concatenate((entry_long, entry_short))
+        dirs  = np.concatenate((np.ones(entry_long.size, dtype=np.int64), -np.ones(entry_short.size, dtype=np.int64)))
+        stop  = entry - dirs * self._stop_loss_atr_distance * np.concatenate((atr[long_], atr[short_]))
+        syms  = list(df.index[long_]) + list(df.index[short_])
+
+        # (state, entry, stop, dir) tuples
+        orders = list(zip([self._state[sym] for sym in syms], entry.tolist(), stop.tolist(), dirs.tolist()))
 
         total_orders = len(orders)
         if total_orders == 0:
             return
 
+        if self._use_options:
+            # don’t trade options before confirm_delay_min after the bell: today's open + delay, same for every order
+            market_open = self.securities[self._spy].exchange.hours.get_previous_market_open(self.time, False)
+            confirm_ready_time = market_open + timedelta(minutes=self._confirm_delay_min)
+
         # ---- Place equity stop-orders (equity mode) OR arm pending (options mode) ----
-        for i, o in enumerate(orders, start=1):
-            e = o['equity']
+        for i, (e, entry_price, stop_price, direction) in enumerate(orders, start=1):
             if e not in self._selected:
                 self._selected.append(e)
 
             if not self._use_options:
                 # ------- EQUITY MODE (as before, with BP guard & retry) -------
                 self._reset_tickets(e)
-                self.add_security(e.symbol, resolution=Resolution.MINUTE, leverage=self._leverage)
 
                 risk_per_pos = (self._stop_loss_risk_size * self.portfolio.total_portfolio_value) / self._max_positions
-                denom = max(abs(o['entry_price'] - o['stop_price']), 1e-6)
+                denom = max(abs(entry_price - stop_price), 1e-6)
                 risk_qty = risk_per_pos / denom
-                sign = 1 if o['dir'] > 0 else -1
+                sign = 1 if direction > 0 else -1
                 risk_qty = int(risk_qty) * sign
 
                 alloc_cap = 1 / self._max_positions
@@ -337,96 +451,108 @@ class OpeningRangeBreakoutUniverseOptions(QCAlgorithm):
                 free_margin = float(self.portfolio.margin_remaining)
                 remaining_orders = total_orders - (i - 1)
                 per_order_margin = (free_margin * self._margin_buffer) / max(1, remaining_orders)
-                lev = float(self.securities[e.symbol].Leverage or 1.0)
-                price = float(o['entry_price'])
+                lev = float(e.sec.leverage or 1.0)
+                price = entry_price
                 max_qty_by_margin = int(max(0, (per_order_margin * lev) / max(price, 1e-6)))
                 qty = int(min(abs(qty), max_qty_by_margin)) * (1 if qty > 0 else -1)
                 if qty == 0:
                     continue
 
-                e.initial_stop = float(o['stop_price'])
+                e.initial_stop = stop_price
                 try:
-                    e.entry_ticket = self.stop_market_order(e.symbol, qty, float(o['entry_price']), tag='Entry')
+                    e.entry_ticket = self.stop_market_order(e.symbol, qty, entry_price, tag='Entry')
                 except Exception:
                     smaller = int(abs(qty) * self._retry_fraction) * (1 if qty > 0 else -1)
                     if smaller != 0:
-                        e.entry_ticket = self.stop_market_order(e.symbol, smaller, float(o['entry_price']), tag='Entry_Retry50')
+                        e.entry_ticket = self.stop_market_order(e.symbol, smaller, entry_price, tag='Entry_Retry50')
                     else:
                         self._reset_tickets(e)
                         continue
 
             else:
                 # ------- OPTIONS MODE: arm pending entry (confirmed later in on_data) -------
-                # Set confirmation window and desired levels on the equity Security object
-                e.pending_dir = o['dir']
-                e.pending_entry = float(o['entry_price'])
-                e.pending_stop = float(o['stop_price'])
+                # Set confirmation window and desired levels on the underlying's _TradeState
+                e.pending_dir = direction  # +1 / -1
+                e.pending_right = OptionRight.Call if direction > 0 else OptionRight.Put
+                e.pending_entry = entry_price
+                e.pending_stop = stop_price
                 e.confirm_count = 0
-                # don’t trade options before confirm_delay_min after the bell
-                self_time_open_delay = self.time_rules.after_market_open(self._spy, self._confirm_delay_min)
-                # we can't schedule per-symbol time here; instead compute a time directly:
-                # confirm ready time = today's date at (9:30 + delay)
-                market_open = self.securities[self._spy].exchange.hours.get_next_market_open(self.time, False)
-                e.confirm_ready_time = market_open + timedelta(minutes=self._confirm_delay_min)
+                e.confirm_ready_time = confirm_ready_time
+                self._pending_confirmation.add(e.symbol)
                 # ensure option chain is added so we have quotes when confirmation happens
                 self._ensure_option_chain(e.symbol)
 
-    # ---------- order events (equity mode only) ----------
+    # ---------- order events (equity mode; options mode only tracks leg fills) ----------
     def on_order_event(self, order_event: OrderEvent) -> None:
         if order_event.status != OrderStatus.FILLED:
             return
-        sec = self.securities[order_event.symbol]
+        # option leg fill -> refresh the underlying's has-position flag (read every bar in options mode)
+        if order_event.symbol.security_type == SecurityType.OPTION:
+            u = self._state.get(order_event.symbol.underlying)
+            if u is not None and order_event.symbol in (u.option_long, u.option_short):
+                self._refresh_option_pos(u)
+        st = self._state.get(order_event.symbol)
+        if st is None:
+            return
+
+        # keep the invested book in sync with every fill (entries, stops, TPs, liquidations)
+        if st.holding.invested:
+            self._invested[order_event.symbol] = st
+        else:
+            self._invested.pop(order_event.symbol, None)
 
         # Entry filled -> arm SL, place TP(50%) if size>=2
-        if sec.entry_ticket and order_event.order_id == sec.entry_ticket.order_id:
-            sec.entry_price = float(order_event.fill_price)
-            if sec.initial_stop is None:
-                direction = 1 if sec.entry_ticket.quantity > 0 else -1
-                sec.initial_stop = sec.entry_price - direction * self._stop_loss_atr_distance * float(sec.atr.current.value)
-            sec.oneR = abs(sec.entry_price - float(sec.initial_stop))
-            sec.moved_to_breakeven = False
-            sec.entry_time = self.time
-            sec.high_water = sec.entry_price
-            sec.low_water = sec.entry_price
-
-            sec.current_stop = float(sec.initial_stop)
-            sec.stop_loss_ticket = self.stop_market_order(
+        if st.entry_ticket and order_event.order_id == st.entry_ticket.order_id:
+            st.entry_price = float(order_event.fill_price)
+            if st.initial_stop is None:
+                direction = 1 if st.entry_ticket.quantity > 0 else -1
+                st.initial_stop = st.entry_price - direction * self._stop_loss_atr_distance * float(st.atr.current.value)
+            st.oneR = abs(st.entry_price - st.initial_stop)
+            st.moved_to_breakeven = False
+            st.entry_time = self.time
+            st.high_water = st.entry_price
+            st.low_water = st.entry_price
+            st.bars_since_stop_move = 0
+            st.trail_threshold = self._trail_threshold(st)
+
+            st.current_stop = st.initial_stop
+            st.stop_loss_ticket = self.stop_market_order(
                 order_event.symbol,
-                -sec.entry_ticket.quantity,
-                sec.current_stop,
+                -st.entry_ticket.quantity,
+                st.current_stop,
                 tag='ATR Stop'
             )
 
-            abs_qty = abs(sec.entry_ticket.quantity)
+            abs_qty = abs(st.entry_ticket.quantity)
             half = abs_qty // 2
             if half >= 1:
-                tp_qty = -half if sec.entry_ticket.quantity > 0 else half
-                tp_price = sec.entry_price + sec.oneR if sec.entry_ticket.quantity > 0 else sec.entry_price - sec.oneR
-                sec.half_qty = half
-                sec.tp_ticket = self.limit_order(order_event.symbol, tp_qty, float(tp_price), tag='TakeProfit_1R')
-
-        elif sec.stop_loss_ticket and order_event.order_id == sec.stop_loss_ticket.order_id:
-            if sec.tp_ticket and sec.tp_ticket.status not in [OrderStatus.CANCELED, OrderStatus.FILLED]:
-                sec.tp_ticket.Cancel("")
-            self._reset_tickets(sec)
-
-        elif sec.tp_ticket and order_event.order_id == sec.tp_ticket.order_id:
-            remaining = self.portfolio[order_event.symbol].quantity
-            if sec.stop_loss_ticket and self.portfolio[order_event.symbol].invested:
-                sec.stop_loss_ticket.UpdateQuantity(-remaining, "")
-            if sec.entry_price is not None and sec.stop_loss_ticket:
-                sec.stop_loss_ticket.UpdateStopPrice(float(sec.entry_price), "")
-                sec.current_stop = float(sec.entry_price)
-                sec.moved_to_breakeven = True
-                sec.last_stop_update_time = self.time
+                tp_qty = -half if st.entry_ticket.quantity > 0 else half
+                tp_price = st.entry_price + st.oneR if st.entry_ticket.quantity > 0 else st.entry_price - st.oneR
+                st.half_qty = half
+                st.tp_ticket = self.limit_order(order_event.symbol, tp_qty, float(tp_price), tag='TakeProfit_1R')
+
+        elif st.stop_loss_ticket and order_event.order_id == st.stop_loss_ticket.order_id:
+            if st.tp_ticket and st.tp_ticket.status not in [OrderStatus.CANCELED, OrderStatus.FILLED]:
+                st.tp_ticket.Cancel("")
+            self._reset_tickets(st)
+
+        elif st.tp_ticket and order_event.order_id == st.tp_ticket.order_id:
+            remaining = st.holding.quantity
+            if st.stop_loss_ticket and st.holding.invested:
+                st.stop_loss_ticket.UpdateQuantity(-remaining, "")
+            if st.entry_price is not None and st.stop_loss_ticket:
+                st.stop_loss_ticket.UpdateStopPrice(st.entry_price, "")
+                st.current_stop = st.entry_price
+                st.moved_to_breakeven = True
+                st.last_stop_update_time = self.time
+                st.bars_since_stop_move = 0
 
     # ---------- options helpers ----------
     def _ensure_option_chain(self, underlying_symbol):
         if underlying_symbol in self._option_handles:
             return
         opt = self.add_option(underlying_symbol)
-        # fetch near expiries and near-ATM strikes; we still hand-pick later
-        opt.set_filter(lambda u: u.expiration(0, self._option_dte_max).strikes(-3, +3))
+        opt.set_filter(self._option_filter)
         opt.set_data_normalization_mode(DataNormalizationMode.Raw)
         self._option_handles[underlying_symbol] = opt
 
@@ -436,48 +562,90 @@ class OpeningRangeBreakoutUniverseOptions(QCAlgorithm):
         opt_symbol = self._option_handles[underlying_symbol].symbol
         return data.option_chains.get(opt_symbol, None)
 
+    def _get_chain_soa(self, underlying_symbol, data):
+        """Decoded chain for this bar (see _chain_to_soa); None when there is no chain."""
+        chain = self._get_chain(underlying_symbol, data)
+        return self._chain_to_soa(chain) if chain is not None and len(chain) > 0 else None
+
     def _tick(self, symbol):
-        sp = self.securities[symbol].symbol_properties
-        tick = getattr(sp, "minimum_price_variation", None) or 0.01
+        st = self._state.get(symbol)
+        if st is not None:
+            return st.tick_size
+        tick = getattr(self.securities[symbol].symbol_properties, "minimum_price_variation", None) or 0.01
         return tick if tick > 0 else 0.01
 
-    def _liquidity_ok(self, c):
-        # Handle different property names across versions:
-        bid = getattr(c, "bid", None)
-        if bid is None: bid = getattr(c, "BidPrice", 0)
-        ask = getattr(c, "ask", None)
-        if ask is None: ask = getattr(c, "AskPrice", 0)
-        oi  = getattr(c, "open_interest", None)
-        if oi is None: oi = getattr(c, "OpenInterest", None)
-
-        if (bid or 0) <= 0 or (ask or 0) <= 0:
-            return False
-        if oi is not None and oi < self._option_min_oi:
-            return False
-        tick = self._tick(c.symbol)
-        if ((ask - bid) / max(tick, 1e-6)) > self._option_max_spread_ticks:
-            return False
-        return True
-
-    def _pick_atm_contract(self, chain, right, spot):
-        best = None
-        best_key = (9999, 9999.0)  # (DTE, |strike-spot|)
-        for c in chain:
-            if getattr(c, "right", getattr(c, "Right", None)) != right:
-                continue
-            if not self._liquidity_ok(c):
-                continue
-            expiry = getattr(c, "expiry", getattr(c, "Expiry", None))
-            if expiry is None:
-                continue
-            dte = (expiry.date() - self.time.date()).days
-            if dte < 0 or dte > self._option_dte_max:
-                continue
-            strike = float(getattr(c, "strike", getattr(c, "Strike", 0.0)) or 0.0)
-            key = (dte, abs(strike - spot))
-            if key < best_key:
-                best, best_key = c, key
-        return best
+    def _chain_to_soa(self, chain):
+        """One pass over the chain -> parallel arrays (contracts, right, expiry, strike, bid, ask, oi, dte, tick,
+        plus the masks call, put and liq_ok)."""
+        contracts = list(chain)
+        n = len(contracts)
+        soa = {
+            'contracts': contracts,
+            'right':  [None] * n,
+            'expiry': [None] * n,
+            'strike': np.zeros(n), 'bid': np.zeros(n), 'ask': np.zeros(n),
+            'oi':     np.full(n, np.nan),  # NaN when the feed has no open interest
+            'dte':    np.full(n, -1, dtype=np.int64),
+            'tick':   np.zeros(n),
+        }
+        if n:
+            # resolve the property naming convention once per chain, not per contract and field
+            probe = contracts[0]
+            get_right  = _attr_getter(probe, "right", "Right")
+            get_expiry = _attr_getter(probe, "expiry", "Expiry")
+            get_strike = _attr_getter(probe, "strike", "Strike")
+            get_bid    = _attr_getter(probe, "bid", "BidPrice")
+            get_ask    = _attr_getter(probe, "ask", "AskPrice")
+            get_oi     = _attr_getter(probe, "open_interest", "OpenInterest")
+        today = self.time.date()
+        for k, c in enumerate(contracts):
+            bid, ask = get_bid(c) or 0, get_ask(c) or 0
+            if bid <= 0 or ask <= 0:
+                continue  # fails liq_ok whatever else it has: skip the remaining reflection
+            soa['bid'][k] = bid
+            soa['ask'][k] = ask
+            soa['right'][k] = get_right(c)
+            expiry = soa['expiry'][k] = get_expiry(c)
+            oi = get_oi(c)
+            if oi is not None:
+                soa['oi'][k] = oi
+            if expiry is not None:
+                soa['dte'][k] = (expiry.date() - today).days
+            soa['strike'][k] = float(get_strike(c) or 0.0)
+            soa['tick'][k] = self._tick(c.symbol)
+        soa['call'] = np.array([r == OptionRight.Call for r in soa['right']], dtype=bool)
+        soa['put']  = np.array([r == OptionRight.Put for r in soa['right']], dtype=bool)
+        # liquidity mask: two-sided quote, spread within N ticks, OI floor (missing OI passes)
+        bid, ask, oi = soa['bid'], soa['ask'], soa['oi']
+        soa['liq_ok'] = ((bid > 0) & (ask > 0)
+                         & ((ask - bid) / np.maximum(soa['tick'], 1e-6) <= self._option_max_spread_ticks)
+                         & (np.isnan(oi) | (oi >= self._option_min_oi)))
+        return soa
+
+    def _pick_atm_and_wing(self, soa, right, spot, direction):
+        """Indices into soa of (ATM contract, OTM spread wing); either may be None.
+
+        ATM: nearest expiry, then closest strike to spot, among liquid contracts of the wanted right.
+        Wing: nearest liquid strike of the same right and expiry beyond the ATM one in the direction of profit.
+        Both share one candidate mask; ties go to the first contract in chain order.
+        """
+        dte = soa['dte']
+        ok = (soa['call'] if right == OptionRight.Call else soa['put']) & soa['liq_ok']
+        cand = np.flatnonzero(ok & (dte >= 0) & (dte <= self._option_dte_max))
+        if cand.size == 0:
+            return None, None
+        strikes = soa['strike']
+        order = np.lexsort((np.abs(strikes[cand] - spot), dte[cand]))  # stable
+        j = int(cand[order[0]])
+
+        # same expiry date as the ATM leg (dte is derived from it), so any wing found can form the spread
+        beyond = np.flatnonzero(ok & (dte == dte[j])
+                                & (strikes > strikes[j] if direction > 0 else strikes < strikes[j]))
+        if beyond.size == 0:
+            return j, None
+        # argmin/argmax return the first occurrence
+        k = np.argmin(strikes[beyond]) if direction > 0 else np.argmax(strikes[beyond])
+        return j, int(beyond[k])
 
     def _mid(self, c):
         bid = getattr(c, "bid", None)
@@ -496,273 +664,271 @@ class OpeningRangeBreakoutUniverseOptions(QCAlgorithm):
         contracts = int(max(1, risk_dollars / (unit_price * 100.0)))
         return contracts * (1 if side_sign > 0 else -1)
 
-    # ---------- throttling helper for equity trailing ----------
-    def _should_move_stop(self, sec, new_price: float) -> bool:
+    # ---------- stop-update throttling (equity trail and options underlying trail) ----------
+    def _trail_threshold(self, st):
+        """Stop-update throttle distance max(N ticks, threshold x ATR); None while ATR is not usable."""
+        atr = float(st.atr.current.value) if st.atr is not None and st.atr.is_ready else 0.0
+        if atr <= 0:
+            return None
+        return max(self._trail_min_ticks * st.tick_size, self._trail_update_threshold_atr * atr)
+
+    def _should_move_stop(self, st, new_price: float) -> bool:
         if new_price is None:
             return False
-        if getattr(sec, "current_stop", None) is None:
+        if getattr(st, "current_stop", None) is None:
             return True
-        if getattr(sec, "last_stop_update_time", None) == self.time:
+        if getattr(st, "last_stop_update_time", None) == self.time:
             return False
-        if not sec.atr.is_ready:
+        if st.trail_threshold is None:
             return False
-        atr = float(sec.atr.current.value)
-        if atr <= 0:
-            return False
-        sp = self.securities[sec.symbol].symbol_properties
-        tick = getattr(sp, "minimum_price_variation", None) or 0.01
-        if tick <= 0:
-            tick = 0.01
-        if abs(new_price - sec.current_stop) < max(self._trail_min_ticks * tick, self._trail_update_threshold_atr * atr):
-            return False
-        return True
+        return abs(new_price - st.current_stop) >= st.trail_threshold
 
     # ---------- main bar handler ----------
     def on_data(self, data: Slice):
+        now = self.time  # one clock read per bar for every stamp and comparison below
         # EQUITY trailing/breakeven (when equity mode)
         if not self._use_options:
-            for e in list(self._selected):
-                if not self.portfolio[e.symbol].invested:
-                    continue
+            # only held positions; the stop updates below never fill synchronously, so no copy is needed
+            for e in self._invested.values():
                 if not (e.entry_ticket and e.stop_loss_ticket and e.oneR and e.entry_price is not None):
                     continue
-                price = float(e.price)
-                qty = self.portfolio[e.symbol].quantity
+                price = float(e.sec.price)
+                qty = e.holding.quantity
                 if qty == 0:
                     continue
                 direction = 1 if qty > 0 else -1
+                atr = float(e.atr.current.value) if e.atr.is_ready else None  # once per position per bar
+                e.bars_since_stop_move += 1
 
-                if e.high_water is None: e.high_water = price
-                if e.low_water  is None: e.low_water  = price
-                e.high_water = max(e.high_water, price) if direction > 0 else e.high_water
-                e.low_water  = min(e.low_water,  price) if direction < 0 else e.low_water
+                # only the side in the trade's direction moves; plain compares, no max/min call
+                if e.high_water is None or (direction > 0 and price > e.high_water): e.high_water = price
+                if e.low_water  is None or (direction < 0 and price < e.low_water):  e.low_water  = price
 
                 move = direction * (price - e.entry_price)
 
                 if (not e.moved_to_breakeven) and (move >= self._breakeven_trigger_R * e.oneR):
-                    if self._should_move_stop(e, float(e.entry_price)):
-                        e.stop_loss_ticket.UpdateStopPrice(float(e.entry_price), "")
-                        e.current_stop = float(e.entry_price)
+                    if self._should_move_stop(e, e.entry_price):
+                        e.stop_loss_ticket.UpdateStopPrice(e.entry_price, "")
+                        e.current_stop = e.entry_price
                         e.moved_to_breakeven = True
-                        e.last_stop_update_time = self.time
+                        e.last_stop_update_time = now
+                        e.bars_since_stop_move = 0
 
-                if e.moved_to_breakeven and e.atr.is_ready:
-                    atr = float(e.atr.current.value)
+                # integer bar-count gate before the price-distance throttle in _should_move_stop
+                if e.moved_to_breakeven and atr is not None and e.bars_since_stop_move >= self._min_stop_bars:
                     if direction > 0:
                         trail_candidate = max(e.entry_price, e.high_water - self._trail_ATR_mult * atr)
                         if (e.current_stop is None or trail_candidate > e.current_stop) and self._should_move_stop(e, trail_candidate):
-                            e.stop_loss_ticket.UpdateStopPrice(float(trail_candidate), "")
-                            e.current_stop = float(trail_candidate)
-                            e.last_stop_update_time = self.time
+                            e.stop_loss_ticket.UpdateStopPrice(trail_candidate, "")
+                            e.current_stop = trail_candidate
+                            e.last_stop_update_time = now
+                            e.bars_since_stop_move = 0
                     else:
                         trail_candidate = min(e.entry_price, e.low_water + self._trail_ATR_mult * atr)
                         if (e.current_stop is None or trail_candidate < e.current_stop) and self._should_move_stop(e, trail_candidate):
-                            e.stop_loss_ticket.UpdateStopPrice(float(trail_candidate), "")
-                            e.current_stop = float(trail_candidate)
-                            e.last_stop_update_time = self.time
+                            e.stop_loss_ticket.UpdateStopPrice(trail_candidate, "")
+                            e.current_stop = trail_candidate
+                            e.last_stop_update_time = now
+                            e.bars_since_stop_move = 0
             return  # equity mode done
 
         # ---------- OPTIONS MODE ----------
-        for e in list(self._selected):
+        # only underlyings with something to do: a pending entry or open option legs
+        held = []
+        # sizing budget, read at most once per bar and only when an entry confirms
+        # (total_portfolio_value is aggregated on the C# side)
+        risk_per_pos = None
+        for sym in self._pending_confirmation | self._option_invested:
+            e = self._state[sym]
             # we use the underlying to confirm and to exit option positions
-            # skip if we have nothing pending and no option position
-            has_pos = False
-            if getattr(e, "option_long", None) and self.portfolio[e.option_long].invested:
-                has_pos = True
-            if getattr(e, "option_short", None) and self.portfolio[e.option_short].invested:
-                has_pos = True
-
-            # 1) ENTRY CONFIRMATION
+            has_pos = e.option_has_pos
+
+            # 1) ENTRY CONFIRMATION (pending test first: the chain is decoded only once confirmation passes)
             if e.pending_dir != 0 and e.pending_entry is not None:
-                if self.time >= (e.confirm_ready_time or self.time):
+                if now >= (e.confirm_ready_time or now):
                     # confirmation by close(s) beyond entry+buffer (already included in pending_entry)
                     # Use current close as bar close
-                    px = float(e.close)
-                    passed = (px >= e.pending_entry) if e.pending_dir > 0 else (px <= e.pending_entry)
+                    px = float(e.sec.close)
+                    passed = e.pending_dir * (px - e.pending_entry) >= 0
                     if passed:
                         e.confirm_count += 1
                     else:
                         e.confirm_count = 0
                     if e.confirm_count >= max(1, self._confirm_bars):
                         # Try to pick contract(s) and enter
-                        chain = self._get_chain(e.symbol, data)
-                        if chain is not None and len(chain) > 0:
-                            spot = float(e.price)
-                            right = OptionRight.Call if e.pending_dir > 0 else OptionRight.Put
-                            best = self._pick_atm_contract(chain, right, spot)
+                        soa = self._get_chain_soa(e.symbol, data)  # one decode shared by the ATM pick and the wing search
+                        if soa is not None:
+                            spot = float(e.sec.price)
+                            j, wing = self._pick_atm_and_wing(soa, e.pending_right, spot, e.pending_dir)
+                            best = soa['contracts'][j] if j is not None else None
                             if best:
                                 mid = self._mid(best)
                                 if mid > 0:
-                                    risk_per_pos = (self._stop_loss_risk_size * self.portfolio.total_portfolio_value) / self._max_positions
+                                    if risk_per_pos is None:
+                                        risk_per_pos = (self._stop_loss_risk_size * self.portfolio.total_portfolio_value) / self._max_positions
                                     qty = self._option_qty_for_risk(mid, risk_per_pos, e.pending_dir)
                                     if qty != 0:
                                         # Place either naked ATM or a debit spread
                                         if not self._option_use_debit_spread:
                                             self.market_order(best.symbol, qty, tag="ORB_ATM_OPTION")
-                                            e.option_long = best.symbol
-                                            e.option_short = None
-                                            e.option_qty = qty
+                                            self._set_option_legs(e, best.symbol, None, qty)
                                         else:
-                                            # find OTM wing (+1 strike away in dir of profit)
-                                            otm = None
-                                            best_strike = float(getattr(best, "strike", getattr(best, "Strike", 0.0)) or 0.0)
-                                            target_otm = None
-                                            if e.pending_dir > 0:
-                                                target_otm = min([float(getattr(c, "strike", getattr(c,"Strike",0.0)) or 0.0)
-                                                                  for c in chain if getattr(c, "right", getattr(c,"Right",None))==right and self._liquidity_ok(c) and float(getattr(c,"strike",getattr(c,"Strike",0.0)) or 0.0) > best_strike] or [None] )
-                                            else:
-                                                target_otm = max([float(getattr(c, "strike", getattr(c,"Strike",0.0)) or 0.0)
-                                                                  for c in chain if getattr(c, "right", getattr(c,"Right",None))==right and self._liquidity_ok(c) and float(getattr(c,"strike",getattr(c,"Strike",0.0)) or 0.0) < best_strike] or [None] )
-                                            if target_otm is not None:
-                                                for c in chain:
-                                                    if getattr(c, "right", getattr(c,"Right",None)) != right: continue
-                                                    s = float(getattr(c,"strike", getattr(c,"Strike",0.0)) or 0.0)
-                                                    if s == target_otm and self._liquidity_ok(c):
-                                                        otm = c
-                                                        break
+                                            # OTM wing (+1 strike away in dir of profit), picked with the ATM contract
+                                            otm = soa['contracts'][wing] if wing is not None else None
                                             # If no wing found, fall back to naked
                                             if not otm:
                                                 self.market_order(best.symbol, qty, tag="ORB_ATM_OPTION")
-                                                e.option_long = best.symbol
-                                                e.option_short = None
-                                                e.option_qty = qty
+                                                self._set_option_legs(e, best.symbol, None, qty)
                                             else:
-                                                # ensure same expiry
-                                                if getattr(otm,"expiry", getattr(otm,"Expiry",None)) != getattr(best,"expiry", getattr(best,"Expiry",None)):
-                                                    # mismatch — fallback
-                                                    self.market_order(best.symbol, qty, tag="ORB_ATM_OPTION")
-                                                    e.option_long = best.symbol
-                                                    e.option_short = None
-                                                    e.option_qty = qty
-                                                else:
-                                                    self.market_order(best.symbol,  qty, tag="ORB_DEBIT_LONG")
-                                                    self.market_order(otm.symbol,  -qty, tag="ORB_DEBIT_SHORT")
-                                                    e.option_long = best.symbol
-                                                    e.option_short = otm.symbol
-                                                    e.option_qty = qty
+                                                # same expiry guaranteed by _pick_atm_and_wing;
+                                                # both legs in one combo order: no window with only one leg filled
+                                                legs = [Leg.create(best.symbol, 1), Leg.create(otm.symbol, -1)]
+                                                self.combo_market_order(legs, qty, tag="ORB_DEBIT_SPREAD")
+                                                self._set_option_legs(e, best.symbol, otm.symbol, qty)
                                         # record entry meta for exit logic
-                                        e.entry_price = float(e.price)
-                                        e.initial_stop = float(e.pending_stop)
+                                        e.entry_price = spot
+                                        e.initial_stop = e.pending_stop
                                         e.oneR = abs(e.pending_entry - e.pending_stop)
                                         e.moved_to_breakeven = False
-                                        e.entry_time = self.time
+                                        e.entry_time = now
                                         e.high_water = e.entry_price
                                         e.low_water = e.entry_price
                                         e.current_stop = e.pending_stop
                                         e.last_stop_update_time = None
+                                        e.bars_since_stop_move = 0
+                                        e.trail_threshold = self._trail_threshold(e)
                                         # clear pending
                                         e.pending_dir = 0
+                                        e.pending_right = None
                                         e.pending_entry = None
                                         e.pending_stop = None
                                         e.confirm_count = 0
+                                        self._pending_confirmation.discard(e.symbol)
+                                        self._option_invested.add(e.symbol)
 
-            # 2) EXIT management for options positions using the UNDERLYING
+            # 2) EXIT management for options positions using the UNDERLYING (batched below)
             if has_pos:
-                price = float(e.price)
-                direction = 1 if (e.option_qty or 0) > 0 else -1  # for debit spreads we use long leg sign
-                # track extremes
-                if e.high_water is None: e.high_water = price
-                if e.low_water  is None: e.low_water  = price
-                e.high_water = max(e.high_water, price) if direction > 0 else e.high_water
-                e.low_water  = min(e.low_water,  price) if direction < 0 else e.low_water
-
-                # move to breakeven after +R (using underlying)
-                move = direction * (price - e.entry_price)
-                if (not e.moved_to_breakeven) and e.oneR and (move >= self._breakeven_trigger_R * e.oneR):
-                    e.current_stop = float(e.entry_price)
-                    e.moved_to_breakeven = True
-                    e.last_stop_update_time = self.time
-
-                # trail after breakeven
-                if e.moved_to_breakeven and e.atr.is_ready:
-                    atr = float(e.atr.current.value)
-                    if direction > 0:
-                        trail_candidate = max(e.entry_price, e.high_water - self._trail_ATR_mult * atr)
-                        if e.current_stop is None or trail_candidate > e.current_stop:
-                            # throttle by bar/ATR change
-                            if self._should_move_stop(e, trail_candidate):
-                                e.current_stop = float(trail_candidate)
-                                e.last_stop_update_time = self.time
-                    else:
-                        trail_candidate = min(e.entry_price, e.low_water + self._trail_ATR_mult * atr)
-                        if e.current_stop is None or trail_candidate < e.current_stop:
-                            if self._should_move_stop(e, trail_candidate):
-                                e.current_stop = float(trail_candidate)
-                                e.last_stop_update_time = self.time
-
-                # stop check on underlying → close option legs by market
-                if e.current_stop is not None:
-                    hit = (price <= e.current_stop) if direction > 0 else (price >= e.current_stop)
-                    if hit:
-                        self._close_option_position(e)
-
-    def _close_option_position(self, sec):
+                held.append(e)
+
+        if held:
+            self._trail_option_stops(held, now)
+
+    def _trail_option_stops(self, held, now):
+        """Breakeven, ATR trail and stop check on the UNDERLYING for open option positions, in one trail_stops call."""
+        def col(values):
+            return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        px    = np.array([e.sec.price for e in held], dtype=np.float64)
+        dirn  = np.array([1 if (e.option_qty or 0) > 0 else -1 for e in held], dtype=np.int64)  # long leg sign for spreads
+        entry = col([e.entry_price for e in held])
+        hw    = col([e.high_water for e in held])
+        lw    = col([e.low_water for e in held])
+        atr   = col([e.atr.current.value if e.atr.is_ready else None for e in held])
+        oneR  = col([e.oneR for e in held])
+        stop  = col([e.current_stop for e in held])
+        # a NaN threshold holds the trail (see trail_stops): also used for the min-stop-bars gate
+        for e in held:
+            e.bars_since_stop_move += 1
+        min_bars = self._min_stop_bars
+        thr   = col([e.trail_threshold if e.bars_since_stop_move >= min_bars else None for e in held])
+        moved = np.array([bool(e.moved_to_breakeven) for e in held], dtype=np.bool_)
+        updated = np.array([e.last_stop_update_time == now for e in held], dtype=np.bool_)
+        hit = np.zeros(len(held), dtype=np.bool_)
+
+        trail_stops(px, dirn, entry, hw, lw, atr, oneR, stop, moved, updated, thr,
+                    self._breakeven_trigger_R, self._trail_ATR_mult, hit)
+
+        for k, e in enumerate(held):
+            e.high_water = float(hw[k])
+            e.low_water = float(lw[k])
+            e.moved_to_breakeven = bool(moved[k])
+            if not np.isnan(stop[k]):
+                e.current_stop = float(stop[k])
+            if updated[k]:
+                e.last_stop_update_time = now
+                e.bars_since_stop_move = 0
+            # stop hit on the underlying → close option legs by market
+            if hit[k]:
+                self._close_option_position(e)
+
+    def _set_option_legs(self, st, long_symbol, short_symbol, qty):
+        st.option_long, st.option_short, st.option_qty = long_symbol, short_symbol, qty
+        # live SecurityHolding references: .invested/.quantity update in place, no portfolio lookup per bar
+        st.long_holding = self.portfolio[long_symbol] if long_symbol is not None else None
+        st.short_holding = self.portfolio[short_symbol] if short_symbol is not None else None
+        self._refresh_option_pos(st)
+
+    def _refresh_option_pos(self, st):
+        # called on leg changes and leg fills only; on_data and the time stop read the flag
+        st.option_has_pos = ((st.long_holding is not None and st.long_holding.invested)
+                             or (st.short_holding is not None and st.short_holding.invested))
+
+    def _close_option_position(self, st):
         # Close long/short legs if invested
-        if getattr(sec, "option_long", None) and self.portfolio[sec.option_long].invested:
-            q = self.portfolio[sec.option_long].quantity
+        if st.long_holding is not None and st.long_holding.invested:
+            q = st.long_holding.quantity
             if q != 0:
-                self.market_order(sec.option_long, -q, tag="Exit_BY_UNDERLYING_STOP")
-        if getattr(sec, "option_short", None) and self.portfolio[sec.option_short].invested:
-            q = self.portfolio[sec.option_short].quantity
+                self.market_order(st.option_long, -q, tag="Exit_BY_UNDERLYING_STOP")
+        if st.short_holding is not None and st.short_holding.invested:
+            q = st.short_holding.quantity
             if q != 0:
-                self.market_order(sec.option_short, -q, tag="Exit_BY_UNDERLYING_STOP")
+                self.market_order(st.option_short, -q, tag="Exit_BY_UNDERLYING_STOP")
         # clean state
-        sec.option_long = None
-        sec.option_short = None
-        sec.option_qty = 0
+        self._set_option_legs(st, None, None, 0)
+        self._option_invested.discard(st.symbol)
         # keep other equity-tracking fields for analytics if you want, or reset:
-        # sec.current_stop = None
+        # st.current_stop = None
 
     def _time_stop_exit(self):
         # At time stop, flatten positions that haven't reached +1R (not at breakeven yet).
-        for e in list(self._selected):
+        # liquidate/_close_option_position never touch _selected, so no copy is needed
+        today = self.time.date()
+        for e in self._selected:
             if not self._use_options:
-                if not self.portfolio[e.symbol].invested:
+                if not e.holding.invested:
                     continue
-                if e.entry_time is None or e.entry_time.date() != self.time.date():
+                if e.entry_time is None or e.entry_time.date() != today:
                     continue
                 if not e.moved_to_breakeven:
                     self.liquidate(e.symbol)
             else:
                 # options mode: close option legs if not at breakeven
-                has_pos = False
-                if getattr(e, "option_long", None) and self.portfolio[e.option_long].invested: has_pos = True
-                if getattr(e, "option_short", None) and self.portfolio[e.option_short].invested: has_pos = True
-                if not has_pos:
+                if not e.option_has_pos:
                     continue
-                if e.entry_time is None or e.entry_time.date() != self.time.date():
+                if e.entry_time is None or e.entry_time.date() != today:
                     continue
                 if not e.moved_to_breakeven:
                     self._close_option_position(e)
 
     # ---------- housekeeping ----------
-    def _reset_tickets(self, sec):
-        sec.entry_ticket = None
-        sec.stop_loss_ticket = None
-        sec.tp_ticket = None
-        sec.entry_price = None
-        sec.initial_stop = None
-        sec.current_stop = None
-        sec.oneR = None
-        sec.moved_to_breakeven = False
-        sec.entry_time = None
-        sec.half_qty = 0
-        sec.high_water = None
-        sec.low_water = None
-        sec.last_stop_update_time = None
+    def _reset_tickets(self, st):
+        st.entry_ticket = None
+        st.stop_loss_ticket = None
+        st.tp_ticket = None
+        st.entry_price = None
+        st.initial_stop = None
+        st.current_stop = None
+        st.oneR = None
+        st.moved_to_breakeven = False
+        st.entry_time = None
+        st.half_qty = 0
+        st.high_water = None
+        st.low_water = None
+        st.last_stop_update_time = None
+        st.bars_since_stop_move = 0
+        st.trail_threshold = None
 
     def _exit(self):
         # EOD: flatten and clean
         if not self._use_options:
             self.liquidate()
         else:
-            # Close all option legs
-            for e in list(self._selected):
-                if getattr(e, "option_long", None) and self.portfolio[e.option_long].invested:
-                    self.market_order(e.option_long, -self.portfolio[e.option_long].quantity, tag="EOD")
-                if getattr(e, "option_short", None) and self.portfolio[e.option_short].invested:
-                    self.market_order(e.option_short, -self.portfolio[e.option_short].quantity, tag="EOD")
+            # Close all option legs: collect the held ones in one pass, then one liquidate call
+            legs = [h.symbol for e in self._selected
+                    for h in (e.long_holding, e.short_holding) if h is not None and h.invested]
+            if legs:
+                self.liquidate(legs, tag="EOD")
         for e in self._selected:
             self._reset_tickets(e)
-            self.remove_security(e.symbol)
         self._selected = []
+        self._pending_confirmation.clear()
+        self._option_invested.clear()